@@ -3,9 +3,16 @@ models.py - Pydantic models for CodeFix MVP
 
 This file defines the BugReport model, which represents a single bug report submitteed by a user.
 """
-from typing import Optional, List
-from pydantic import BaseModel, Field
-from datetime import datetime
+from functools import partial
+from typing import Optional, Tuple
+from pydantic import BaseModel, ConfigDict, Field
+from datetime import datetime, timezone
+
+# Length caps, so an oversized payload is rejected during validation instead of
+# being embedded and searched
+MAX_TITLE_LENGTH = 256
+MAX_DESCRIPTION_LENGTH = 8192
+MAX_CODE_SNIPPET_LENGTH = 32768
 
 
 class BugReport(BaseModel):
@@ -34,48 +41,52 @@ class BugReport(BaseModel):
 
     title: str = Field(
         ...,
-        example="App crashes on login",
+        max_length=MAX_TITLE_LENGTH,
+        json_schema_extra={"example": "App crashes on login"},
         description="Short summary of the issue"
     )
 
     description: str = Field(
         ...,
-        example="The app crashes when I try to log in with a valid account.",
+        min_length=1,
+        max_length=MAX_DESCRIPTION_LENGTH,
+        json_schema_extra={"example": "The app crashes when I try to log in with a valid account."},
         description="Detailed description of the bug"
     )
 
     steps_to_reproduce: Optional[str] = Field(
         default=None,
-        example="1. Open the app\n2. Enter credentials\n3. Tap login",
+        json_schema_extra={"example": "1. Open the app\n2. Enter credentials\n3. Tap login"},
         description="Steps someone else could follow to reproduce the bug"
     )
 
     expected_behavior: Optional[str] = Field(
         default=None,
-        example="App should log in and redirect to dashboard",
+        json_schema_extra={"example": "App should log in and redirect to dashboard"},
         description="What the user expected to happen"
     )
 
     actual_behavior: Optional[str] = Field(
         default=None,
-        example="App crashes with a NullPointerException",
+        json_schema_extra={"example": "App crashes with a NullPointerException"},
         description="What actually happened instead"
     )
 
     code_snippet: Optional[str] = Field(
         default=None,
-        example="const result = user && user.token;",
+        max_length=MAX_CODE_SNIPPET_LENGTH,
+        json_schema_extra={"example": "const result = user && user.token;"},
         description="The relevant piece of code where the bug might be"
     )
 
     language: Optional[str] = Field(
         default=None,
-        example="JavaScript",
+        json_schema_extra={"example": "JavaScript"},
         description="Programming language of the code snippet"
     )
 
     created_at: Optional[datetime] = Field(
-        default_factory=datetime.utcnow,
+        default_factory=partial(datetime.now, timezone.utc),  # C-level call, no lambda frame
         description="Timestamp when the report was created"
     )
 
@@ -84,8 +95,13 @@ class BugReport(BaseModel):
         description="True if the bug has been resolved"
     )
 
-    class Config:
-        orm_mode = True  # Allows compatibility with ORMs
+    model_config = ConfigDict(
+        from_attributes=True,       # Allows compatibility with ORMs
+        frozen=True,                # Read-only once validated (and hashable)
+        validate_default=False,     # Defaults such as created_at are trusted, not re-validated
+        str_strip_whitespace=False, # Keep the text exactly as submitted
+        extra='ignore'              # Unknown fields are dropped, not stored
+    )
 
 
 class BugSolution(BaseModel):
@@ -93,29 +109,33 @@ class BugSolution(BaseModel):
     BugSolution defines the structure of a solution returned by the CodeFix AI.
     
     This represents the AI's analysis and suggested fix for a bug report.
+    Frozen (tags included, hence a tuple) because the AI engine caches solutions
+    and shares them across requests.
     """
     
+    model_config = ConfigDict(frozen=True)
+    
     title: str = Field(
         ...,
-        example="Fix React State Mutation",
+        json_schema_extra={"example": "Fix React State Mutation"},
         description="Short title describing the solution"
     )
     
     solution: str = Field(
         ...,
-        example="React doesn't detect direct state mutations. You need to create a new array or object to trigger re-renders.",
+        json_schema_extra={"example": "React doesn't detect direct state mutations. You need to create a new array or object to trigger re-renders."},
         description="Detailed explanation of the solution"
     )
     
     code_example: str = Field(
         ...,
-        example="// ❌ Direct mutation\ntodos.push(item);\nsetTodos(todos);\n\n// ✅ New array\nsetTodos([...todos, item]);",
+        json_schema_extra={"example": "// ❌ Direct mutation\ntodos.push(item);\nsetTodos(todos);\n\n// ✅ New array\nsetTodos([...todos, item]);"},
         description="Code examples showing wrong vs right approach"
     )
     
     source: str = Field(
         ...,
-        example="React Documentation - State Updates",
+        json_schema_extra={"example": "React Documentation - State Updates"},
         description="Source of the solution (documentation, best practices, etc.)"
     )
     
@@ -123,13 +143,13 @@ class BugSolution(BaseModel):
         ...,
         ge=0.0,
         le=1.0,
-        example=0.89,
+        json_schema_extra={"example": 0.89},
         description="AI confidence score (0.0 to 1.0)"
     )
     
-    tags: List[str] = Field(
-        default=[],
-        example=["react", "state", "mutation", "hooks"],
+    tags: Tuple[str, ...] = Field(
+        default=(),
+        json_schema_extra={"example": ["react", "state", "mutation", "hooks"]},
         description="Tags for categorizing the solution"
     )
     
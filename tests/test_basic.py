@@ -0,0 +1,226 @@
+"""
+test_basic.py - Basic functionality and AI tests for CodeFix
+
+Run from the repository root with: python -m pytest
+"""
+import sys
+from pathlib import Path
+
+# Make the top-level modules (ai_engine, models) importable from tests/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+import pytest
+from pydantic import ValidationError
+
+import ai_engine
+from models import BugReport, BugSolution
+
+
+# =============================================================================
+# NUMBA KERNELS
+# =============================================================================
+
+def test_kernel_is_cacheable():
+    """Kernels must not read dynamic globals, or numba recompiles them on every import."""
+    kernel = ai_engine._best_match
+    assert kernel.overloads, "signature-pinned kernels compile at import"
+    for overload in kernel.overloads.values():
+        assert not overload.library.has_dynamic_globals
+
+
+# =============================================================================
+# MODELS
+# =============================================================================
+
+def test_bug_solution_is_immutable():
+    """Cached solutions are shared across requests, so nothing in them may change."""
+    solution = BugSolution(title="t", solution="s", code_example="c", source="test",
+                           confidence=0.9, tags=["react", "state"])
+    assert solution.tags == ("react", "state")
+    hash(solution)  # only hashable if every field is immutable
+    with pytest.raises(ValidationError):
+        solution.title = "changed"
+
+
+# =============================================================================
+# SOLUTION CACHE
+# =============================================================================
+
+DIM = 8
+
+
+def _unit(i: int) -> np.ndarray:
+    """The i-th standard basis vector: unit length, orthogonal to the others."""
+    vector = np.zeros(DIM, dtype=np.float32)
+    vector[i] = 1.0
+    return vector
+
+
+def _solution(title: str) -> BugSolution:
+    return BugSolution(title=title, solution="s", code_example="c", source="test", confidence=0.9)
+
+
+def test_solution_cache_exact_hit():
+    cache = ai_engine.SolutionCache(DIM, capacity=4)
+    solution = _solution("a")
+    cache.put(b"a", _unit(0), solution)
+    
+    assert cache.get(b"a") is solution
+    assert cache.get(b"b") is None
+
+
+def test_solution_cache_similar_hit_and_miss():
+    cache = ai_engine.SolutionCache(DIM, capacity=4, threshold=0.95)
+    solution = _solution("a")
+    cache.put(b"a", _unit(0), solution)
+    
+    near = ai_engine._l2_normalize(_unit(0) + 0.1 * _unit(1))  # cosine ~0.995
+    far = ai_engine._l2_normalize(_unit(0) + _unit(1))         # cosine ~0.707
+    assert cache.get_similar(b"far", far) is None
+    assert cache.get_similar(b"near", near) is solution
+    # The near-duplicate is now cached under its own digest too
+    assert cache.get(b"near") is solution
+    assert cache.get(b"far") is None
+
+
+def test_solution_cache_similar_hit_refreshes_recency():
+    cache = ai_engine.SolutionCache(DIM, capacity=2, threshold=0.95)
+    cache.put(b"a", _unit(0), _solution("a"))
+    cache.put(b"b", _unit(1), _solution("b"))
+    
+    # Matching "a" by similarity makes "b" the least recently used entry
+    assert cache.get_similar(b"a2", _unit(0)).title == "a"
+    assert cache.get(b"a").title == "a"
+    assert cache.get(b"b") is None
+
+
+def test_solution_cache_eviction_reuses_slot():
+    cache = ai_engine.SolutionCache(DIM, capacity=2)
+    cache.put(b"a", _unit(0), _solution("a"))
+    cache.put(b"b", _unit(1), _solution("b"))
+    cache.get(b"a")  # "b" is now least recently used
+    cache.put(b"c", _unit(2), _solution("c"))
+    
+    assert len(cache) == 2
+    assert len(cache._solutions) == 2
+    assert cache.get(b"b") is None
+    assert cache.get(b"a").title == "a"
+    assert cache.get(b"c").title == "c"
+    # "c" took over "b"'s slot, embedding included
+    assert cache.get_similar(b"b2", _unit(1)) is None
+    assert cache.get_similar(b"c2", _unit(2)).title == "c"
+
+
+def test_solution_cache_matrix_grows_to_capacity():
+    capacity = 40
+    cache = ai_engine.SolutionCache(64, capacity=capacity)
+    assert len(cache._matrix) == 16
+    
+    for i in range(capacity + 5):
+        embedding = np.zeros(64, dtype=np.float32)
+        embedding[i % 64] = 1.0
+        cache.put(str(i).encode(), embedding, _solution(str(i)))
+    
+    assert len(cache) == capacity
+    assert len(cache._matrix) == capacity  # 16 -> 32 -> 40, never past capacity
+    assert cache.get(b"0") is None
+    assert cache.get(str(capacity + 4).encode()).title == str(capacity + 4)
+
+
+# =============================================================================
+# BATCHED SEARCH
+# =============================================================================
+
+CORPUS_SIZE = 200
+CORPUS_DIM = 32
+
+
+def _engine(index: bool = False) -> ai_engine.BugSolutionAI:
+    """An engine over a random unit-length corpus, skipping model and file loading."""
+    rng = np.random.default_rng(0)
+    engine = ai_engine.BugSolutionAI.__new__(ai_engine.BugSolutionAI)
+    engine.examples = [
+        {
+            'title': f"Example {row}",
+            'solution': "s",
+            'code_example': "c",
+            'source': "test",
+            'tags': [f"group{row % 10}"],
+            'keywords': [],
+        }
+        for row in range(CORPUS_SIZE)
+    ]
+    embeddings = rng.standard_normal((CORPUS_SIZE, CORPUS_DIM)).astype(np.float32)
+    engine.example_embeddings = ai_engine._l2_normalize(embeddings)
+    engine.index = engine._build_index(engine.example_embeddings) if index else None
+    engine._postings = engine._build_postings()
+    engine._solution_cache = ai_engine.SolutionCache(CORPUS_DIM)
+    engine.model_loaded = True
+    return engine
+
+
+def _queries(engine: ai_engine.BugSolutionAI, rows, prefix: str):
+    """Bug reports with embeddings close to the given corpus rows."""
+    rng = np.random.default_rng(1)
+    reports, embeddings = [], []
+    for n, row in enumerate(rows):
+        # Kept in float32 throughout: a NumPy float64 scalar would promote it under NumPy 2
+        noise = rng.standard_normal(CORPUS_DIM, dtype=np.float32) * np.float32(0.3 / np.sqrt(CORPUS_DIM))
+        embeddings.append(ai_engine._l2_normalize(engine.example_embeddings[row] + noise))
+        reports.append(BugReport(title="t", description=f"{prefix} report {n}"))
+    return reports, embeddings
+
+
+def _assert_batch_matches_single(engine, reports, embeddings):
+    batched = engine.find_solutions(reports, embeddings)
+    engine._solution_cache = ai_engine.SolutionCache(CORPUS_DIM)  # search again, not cache hits
+    single = [engine.find_solution(report, embedding) for report, embedding in zip(reports, embeddings)]
+    
+    assert all(solution is not None for solution in batched)
+    for a, b in zip(batched, single):
+        assert a.title == b.title
+        assert a.similarity_score == pytest.approx(b.similarity_score, abs=1e-5)
+        assert a.confidence == pytest.approx(b.confidence, abs=1e-5)
+
+
+def test_find_solutions_matches_find_solution_full_scan():
+    # Batched: one sgemm over the corpus; single: the fused _best_match kernel
+    engine = _engine()
+    reports, embeddings = _queries(engine, [3, 57, 120, 199], prefix="unindexed")
+    _assert_batch_matches_single(engine, reports, embeddings)
+
+
+def test_find_solutions_matches_find_solution_float64_queries():
+    # Caller-supplied embeddings of another dtype are converted, not dropped as "no match"
+    engine = _engine()
+    reports, embeddings = _queries(engine, [3, 57, 120, 199], prefix="unindexed")
+    assert embeddings[0].dtype == np.float32
+    _assert_batch_matches_single(engine, reports, [embedding.astype(np.float64) for embedding in embeddings])
+
+
+def test_find_solutions_matches_find_solution_prefiltered():
+    engine = _engine()
+    reports, embeddings = _queries(engine, [4, 14, 25], prefix="group4 group5")
+    assert engine._candidate_rows(reports[0].description) is not None
+    _assert_batch_matches_single(engine, reports, embeddings)
+
+
+def test_find_solutions_matches_find_solution_hnsw(monkeypatch):
+    monkeypatch.setattr(ai_engine, "ANN_MIN_EXAMPLES", CORPUS_SIZE)
+    engine = _engine(index=True)
+    assert engine.index is not None
+    reports, embeddings = _queries(engine, [3, 57, 120, 199], prefix="unindexed")
+    _assert_batch_matches_single(engine, reports, embeddings)
+
+
+def test_full_scan_top_k_is_sorted_and_starts_with_best_match():
+    engine = _engine()
+    _, embeddings = _queries(engine, [57], prefix="unindexed")
+    rows, scores = engine._search_rows(embeddings[0], None, k=5)
+    best_row, best_score = engine._search_rows(embeddings[0], None, k=1)
+    
+    assert len(rows) == 5
+    assert list(scores) == sorted(scores, reverse=True)
+    assert rows[0] == best_row[0] == 57
+    assert scores[0] == pytest.approx(best_score[0], abs=1e-5)